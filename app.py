@@ -5,13 +5,13 @@ Aplicação Streamlit principal
 import streamlit as st
 import pandas as pd
 from src.data_loader import (
-    load_dataset, clean_hdi_data, get_available_countries,
+    load_clean_hdi_data, load_metadata, get_available_countries,
     get_available_years, filter_data
 )
-from src.rag_system import RAGSystem
+from src.rag_system import RAGSystem, get_knowledge_base_mtimes
 from src.visualizations import (
     plot_hdi_timeline, plot_hdi_comparison,
-    plot_hdi_heatmap, plot_hdi_statistics
+    plot_hdi_heatmap, plot_hdi_statistics, clear_plot_cache
 )
 from src.config import VIZ_CONFIG
 
@@ -24,22 +24,75 @@ st.set_page_config(
 )
 
 # Inicializar sistema RAG (com cache)
-@st.cache_resource
-def init_rag_system():
+# A chave com os mtimes das fontes recria o sistema quando a documentação muda;
+# os metadados (já lidos por load_metadata, que relê o JSON só quando ele muda)
+# não entram no hash do cache (prefixo _). Só a versão atual fica em cache:
+# cada entrada guarda um modelo e uma base de conhecimento inteiros
+@st.cache_resource(max_entries=1)
+def init_rag_system(_metadata: dict, knowledge_base_key: tuple):
     """Inicializa o sistema RAG (cacheado para performance)"""
-    return RAGSystem()
+    return RAGSystem(metadata=_metadata)
 
 # Carregar dados (com cache)
 @st.cache_data
 def load_data():
     """Carrega e limpa os dados do HDI"""
-    df, metadata = load_dataset("hdi")
-    df_clean = clean_hdi_data(df)
-    return df_clean, metadata
+    # Dados novos invalidam os gráficos memoizados
+    clear_plot_cache()
+    return load_clean_hdi_data()
+
+# Filtrar dados (com cache por combinação de filtros). cache_resource devolve o
+# mesmo objeto a cada rerun, o que permite aos gráficos memoizar por identidade;
+# o DataFrame retornado não deve ser modificado
+@st.cache_resource(max_entries=64)
+def get_filtered_data(countries: tuple, year_range: tuple):
+    """Aplica os filtros da sidebar (cacheado para evitar refiltrar a cada rerun)"""
+    return filter_data(
+        df,
+        countries=list(countries) if countries else None,
+        years=year_range
+    )
+
+# Opções dos filtros (com cache)
+@st.cache_data(show_spinner=False)
+def get_countries():
+    """Lista de países disponíveis (cacheada)"""
+    return get_available_countries(df)
+
+@st.cache_data(show_spinner=False)
+def get_years():
+    """Range de anos disponível (cacheado)"""
+    return get_available_years(df)
+
+@st.cache_data(show_spinner=False)
+def get_year_options(year_range: tuple):
+    """Anos do período como tupla (cacheada)"""
+    return tuple(range(year_range[0], year_range[1] + 1))
+
+# Estatísticas por país no período (com cache; filtrar países só fatia as linhas)
+@st.cache_data
+def get_entity_stats(year_range: tuple):
+    """Calcula estatísticas do HDI por país para um período"""
+    df_years = filter_data(df, years=year_range)
+    stats_df = df_years.groupby("Entity", observed=True)["Human Development Index"].agg([
+        "mean", "std", "min", "max", "count"
+    ]).round(3)
+    stats_df.columns = ["Média", "Desvio Padrão", "Mínimo", "Máximo", "Observações"]
+    return stats_df
+
+# HDI por ano e país em formato largo (com cache)
+@st.cache_data
+def get_hdi_by_year():
+    """Pivota o HDI em uma tabela Ano x País"""
+    return df.set_index(["Year", "Entity"])["Human Development Index"].unstack("Entity")
 
 # Carregar dados
-df, metadata = load_data()
-rag_system = init_rag_system()
+df, _ = load_data()
+
+# Opções dos filtros calculadas uma vez por sessão (tupla imutável, sem reordenar)
+if "countries_opts" not in st.session_state:
+    st.session_state.countries_opts = tuple(get_countries())
+    st.session_state.year_bounds = get_years()
 
 # Sidebar
 st.sidebar.title("🌍 Dashboard Our World in Data")
@@ -64,7 +117,7 @@ if page == "📊 Visualizações":
     st.sidebar.header("Filtros")
     
     # Filtro de países
-    available_countries = get_available_countries(df)
+    available_countries = st.session_state.countries_opts
     selected_countries = st.sidebar.multiselect(
         "Selecione países",
         options=available_countries,
@@ -72,7 +125,7 @@ if page == "📊 Visualizações":
     )
     
     # Filtro de anos
-    min_year, max_year = get_available_years(df)
+    min_year, max_year = st.session_state.year_bounds
     year_range = st.sidebar.slider(
         "Selecione o período",
         min_value=min_year,
@@ -81,11 +134,7 @@ if page == "📊 Visualizações":
     )
     
     # Aplicar filtros
-    df_filtered = filter_data(
-        df,
-        countries=selected_countries if selected_countries else None,
-        years=year_range
-    )
+    df_filtered = get_filtered_data(tuple(selected_countries), tuple(year_range))
     
     # Tabs para diferentes visualizações
     tab1, tab2, tab3, tab4 = st.tabs([
@@ -95,52 +144,63 @@ if page == "📊 Visualizações":
         "📊 Estatísticas"
     ])
     
+    # Chaves fixas nos gráficos: o componente é reaproveitado entre reruns e o
+    # navegador atualiza a figura com Plotly.react em vez de recriá-la
     with tab1:
         st.subheader("Evolução do HDI ao Longo do Tempo")
         if not df_filtered.empty:
             fig = plot_hdi_timeline(df_filtered, selected_countries)
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(fig, use_container_width=True, key="chart_timeline")
             
-            # Estatísticas rápidas
+            # Estatísticas rápidas (média e máximo em uma única chamada)
+            hdi_summary = df_filtered["Human Development Index"].agg(["mean", "max"])
             col1, col2, col3, col4 = st.columns(4)
             with col1:
                 st.metric("Países Selecionados", len(selected_countries) if selected_countries else len(available_countries))
             with col2:
                 st.metric("Período", f"{year_range[0]}-{year_range[1]}")
             with col3:
-                st.metric("HDI Médio", f"{df_filtered['Human Development Index'].mean():.3f}")
+                st.metric("HDI Médio", f"{hdi_summary['mean']:.3f}")
             with col4:
-                st.metric("HDI Máximo", f"{df_filtered['Human Development Index'].max():.3f}")
+                st.metric("HDI Máximo", f"{hdi_summary['max']:.3f}")
         else:
             st.warning("Selecione pelo menos um país para visualizar os dados.")
     
     with tab2:
         st.subheader("Comparação de HDI entre Países")
+        years_list = get_year_options(tuple(year_range))
         comparison_year = st.selectbox(
             "Selecione o ano para comparação",
-            options=range(year_range[0], year_range[1] + 1),
-            index=len(range(year_range[0], year_range[1] + 1)) - 1
+            options=years_list,
+            index=len(years_list) - 1
         )
         
         top_n = st.slider("Número de países a mostrar", 5, 50, 20)
         
         if comparison_year:
-            fig = plot_hdi_comparison(df_filtered, comparison_year, top_n)
-            st.plotly_chart(fig, use_container_width=True)
+            # Fatiar o pivot cacheado em vez de refiltrar o DataFrame
+            hdi_year = get_hdi_by_year().loc[comparison_year]
+            if selected_countries:
+                hdi_year = hdi_year.reindex(selected_countries)
+            df_year = (hdi_year.dropna()
+                       .rename("Human Development Index")
+                       .reset_index()
+                       .assign(Year=comparison_year))
+            fig = plot_hdi_comparison(df_year, comparison_year, top_n)
+            st.plotly_chart(fig, use_container_width=True, key="chart_comparison")
     
     with tab3:
         st.subheader("Heatmap de HDI por País e Ano")
         if selected_countries:
-            max_countries = min(len(selected_countries), 15)
             heatmap_countries = st.multiselect(
                 "Selecione países para o heatmap (máx 15)",
                 options=selected_countries,
-                default=selected_countries[:max_countries]
+                default=selected_countries[:15]
             )
             
             if heatmap_countries:
                 fig = plot_hdi_heatmap(df_filtered, heatmap_countries)
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(fig, use_container_width=True, key="chart_heatmap")
         else:
             st.info("Selecione países nos filtros para visualizar o heatmap.")
     
@@ -148,20 +208,22 @@ if page == "📊 Visualizações":
         st.subheader("Estatísticas Descritivas do HDI")
         if not df_filtered.empty:
             fig = plot_hdi_statistics(df_filtered, selected_countries)
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(fig, use_container_width=True, key="chart_statistics")
             
             # Tabela com estatísticas detalhadas
             st.subheader("Estatísticas Detalhadas")
-            stats_df = df_filtered.groupby("Entity")["Human Development Index"].agg([
-                "mean", "std", "min", "max", "count"
-            ]).round(3)
-            stats_df.columns = ["Média", "Desvio Padrão", "Mínimo", "Máximo", "Observações"]
+            stats_df = get_entity_stats(tuple(year_range))
+            if selected_countries:
+                stats_df = stats_df[stats_df.index.isin(selected_countries)]
             st.dataframe(stats_df, use_container_width=True)
         else:
             st.warning("Selecione países para visualizar as estatísticas.")
 
 # Página: Sistema RAG
 elif page == "🤖 Sistema RAG":
+    # Modelo de embeddings carregado só quando a página do RAG é aberta
+    rag_system = init_rag_system(load_metadata("hdi"), get_knowledge_base_mtimes())
+    
     st.title("🤖 Sistema RAG - Demonstração Educacional")
     
     st.markdown("""
@@ -295,7 +357,7 @@ elif page == "ℹ️ Sobre":
     - **Plotly**: Biblioteca para visualizações interativas
     - **Pandas**: Manipulação e análise de dados
     - **Sentence Transformers**: Modelos para geração de embeddings
-    - **Scikit-learn**: Cálculo de similaridade de cosseno
+    - **NumPy**: Cálculo de similaridade de cosseno
     
     ### Fonte dos Dados
     
@@ -337,10 +399,10 @@ elif page == "ℹ️ Sobre":
     col1, col2 = st.columns(2)
     with col1:
         st.metric("Total de Registros", len(df))
-        st.metric("Países Únicos", len(get_available_countries(df)))
+        st.metric("Países Únicos", len(st.session_state.countries_opts))
     
     with col2:
-        min_year, max_year = get_available_years(df)
+        min_year, max_year = st.session_state.year_bounds
         st.metric("Período", f"{min_year} - {max_year}")
         st.metric("Anos de Dados", max_year - min_year + 1)
     
@@ -19,17 +19,33 @@ DATASETS = {
     "hdi": {
         "csv_file": DATABASE_DIR / "human-development-index.csv",
         "metadata_file": DATABASE_DIR / "human-development-index.metadata.json",
+        "parquet_file": DATABASE_DIR / "human-development-index.clean.parquet",  # Cache dos dados limpos
+        "columns": ["Entity", "Code", "Year", "Human Development Index", "World regions according to OWID"],
+        "cache_version": 2,  # Incrementar quando clean_hdi_data mudar (invalida o Parquet)
         "name": "Human Development Index",
         "description": "Índice de Desenvolvimento Humano (HDI)"
     }
 }
 
+# Entidades do dataset que não são países (regiões agregadas)
+NON_COUNTRY_ENTITIES = frozenset({
+    "Africa", "Asia", "Europe", "North America", "South America",
+    "Oceania", "World", "European Union"
+})
+
 # Configurações RAG
 RAG_CONFIG = {
     "model_name": "sentence-transformers/all-MiniLM-L6-v2",
+    "onnx_file_name": "onnx/model_quint8_avx2.onnx",  # Modelo ONNX quantizado (INT8) para CPU
+    "query_cache_size": 256,  # Embeddings de queries mantidos em cache (LRU)
     "top_k": 5,  # Número de documentos mais relevantes a retornar
     "similarity_threshold": 0.3,  # Threshold mínimo de similaridade
-    "embeddings_cache_file": EMBEDDINGS_DIR / "knowledge_base_embeddings.pkl"
+    "chunk_size": 256,  # Tamanho (em tokens) dos trechos da documentação
+    "chunk_overlap": 32,  # Sobreposição (em tokens) entre trechos consecutivos
+    "readme_file": DATABASE_DIR / "readme.md",  # Documentação usada na base de conhecimento
+    "embeddings_cache_file": EMBEDDINGS_DIR / "knowledge_base_embeddings.npy",
+    "documents_cache_file": EMBEDDINGS_DIR / "knowledge_base_documents.jsonl",
+    "cache_version": 4  # Incrementar para invalidar caches antigos
 }
 
 # Configurações de visualização
@@ -1,11 +1,15 @@
 """
 Módulo para carregar e processar datasets do Our World in Data
 """
+import functools
 import pandas as pd
+import numpy as np
 import json
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pathlib import Path
 from typing import Dict, Optional, Tuple
-from src.config import DATASETS
+from src.config import DATASETS, NON_COUNTRY_ENTITIES
 
 
 def load_dataset(dataset_key: str = "hdi") -> Tuple[pd.DataFrame, Dict]:
@@ -27,15 +31,82 @@ def load_dataset(dataset_key: str = "hdi") -> Tuple[pd.DataFrame, Dict]:
     if not config["csv_file"].exists():
         raise FileNotFoundError(f"Arquivo CSV não encontrado: {config['csv_file']}")
     
-    df = pd.read_csv(config["csv_file"])
+    df = pd.read_csv(config["csv_file"], usecols=config.get("columns"))
     
-    # Carregar metadados
-    metadata = {}
-    if config["metadata_file"].exists():
-        with open(config["metadata_file"], "r", encoding="utf-8") as f:
-            metadata = json.load(f)
+    return df, load_metadata(dataset_key)
+
+
+def load_clean_hdi_data() -> Tuple[pd.DataFrame, Dict]:
+    """
+    Carrega os dados do HDI já limpos, usando um cache Parquet quando disponível
+    
+    O CSV só é lido e limpo quando o Parquet não existe, é mais antigo que ele
+    ou foi gravado por outra versão da limpeza (cache_version).
+    
+    Returns:
+        Tupla com (DataFrame limpo, metadados)
+    """
+    config = DATASETS["hdi"]
+    parquet_file = config["parquet_file"]
+    
+    if (parquet_file.exists() and config["csv_file"].exists()
+            and parquet_file.stat().st_mtime >= config["csv_file"].stat().st_mtime):
+        try:
+            if _parquet_cache_version(parquet_file) == config["cache_version"]:
+                df_clean = pd.read_parquet(parquet_file, engine="pyarrow", columns=config["columns"])
+                return df_clean, load_metadata("hdi")
+            print("Cache Parquet de outra versão da limpeza. Recarregando CSV...")
+        except Exception as e:
+            print(f"Erro ao carregar cache Parquet: {e}. Recarregando CSV...")
+    
+    df, metadata = load_dataset("hdi")
+    df_clean = clean_hdi_data(df)
+    
+    try:
+        # Versão da limpeza gravada nos metadados chave-valor do Parquet
+        table = pa.Table.from_pandas(df_clean, preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b"cache_version": str(config["cache_version"]).encode()
+        })
+        pq.write_table(table, parquet_file, compression="zstd")
+    except Exception as e:
+        print(f"Erro ao salvar cache Parquet: {e}")
+    
+    return df_clean, metadata
+
+
+def _parquet_cache_version(parquet_file: Path) -> Optional[int]:
+    """Lê a versão da limpeza gravada no cache Parquet (None se ausente)"""
+    version = (pq.read_schema(parquet_file).metadata or {}).get(b"cache_version")
+    return int(version) if version is not None else None
+
+
+def load_metadata(dataset_key: str = "hdi") -> Dict:
+    """
+    Carrega o JSON de metadados de um dataset (vazio se não existir)
+    
+    O arquivo só é lido de novo quando sua data de modificação muda; o
+    dicionário retornado é compartilhado entre as chamadas e não deve ser modificado.
     
-    return df, metadata
+    Args:
+        dataset_key: Chave do dataset em DATASETS config
+        
+    Returns:
+        Dicionário com os metadados
+    """
+    metadata_file = DATASETS[dataset_key]["metadata_file"]
+    mtime = metadata_file.stat().st_mtime if metadata_file.exists() else 0.0
+    return _read_metadata(metadata_file, mtime)
+
+
+@functools.lru_cache(maxsize=4)
+def _read_metadata(metadata_file: Path, mtime: float) -> Dict:
+    """Lê o JSON de metadados (memoizado por arquivo e mtime)"""
+    if not metadata_file.exists():
+        return {}
+    with open(metadata_file, "r", encoding="utf-8") as f:
+        return json.load(f)
 
 
 def clean_hdi_data(df: pd.DataFrame) -> pd.DataFrame:
@@ -48,21 +119,25 @@ def clean_hdi_data(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         DataFrame limpo
     """
-    df_clean = df.copy()
-    
-    # Remover linhas com valores NaN no HDI
-    df_clean = df_clean.dropna(subset=["Human Development Index"])
-    
-    # Garantir que Year é numérico
-    df_clean["Year"] = pd.to_numeric(df_clean["Year"], errors="coerce")
-    
-    # Remover linhas com Year inválido
-    df_clean = df_clean.dropna(subset=["Year"])
-    
-    # Ordenar por Entity e Year
-    df_clean = df_clean.sort_values(["Entity", "Year"])
-    
-    return df_clean
+    # HDI é uma razão em [0, 1] com 3 casas decimais: float32 basta
+    dtypes = {"Year": "int32", "Human Development Index": "float32"}
+    # Colunas de texto repetitivas como categóricas (isin/groupby por códigos inteiros)
+    for column in ("Entity", "Code", "World regions according to OWID"):
+        if column in df:
+            dtypes[column] = "category"
+    
+    # Encadear as etapas para materializar um único DataFrame de saída
+    return (
+        df
+        # Remover linhas com valores NaN no HDI
+        .dropna(subset=["Human Development Index"])
+        # Garantir que Year é numérico e remover anos inválidos
+        .assign(Year=lambda d: pd.to_numeric(d["Year"], errors="coerce"))
+        .dropna(subset=["Year"])
+        .astype(dtypes)
+        # Ordenar por Entity e Year
+        .sort_values(["Entity", "Year"], kind="stable", ignore_index=True)
+    )
 
 
 def get_available_countries(df: pd.DataFrame) -> list:
@@ -75,12 +150,10 @@ def get_available_countries(df: pd.DataFrame) -> list:
     Returns:
         Lista ordenada de países únicos
     """
-    countries = df["Entity"].unique().tolist()
+    # Com Entity categórica, unique() opera sobre os códigos inteiros
+    countries = df["Entity"].unique()
     # Remover entidades que não são países (como regiões)
-    regions = ["Africa", "Asia", "Europe", "North America", "South America", 
-               "Oceania", "World", "European Union"]
-    countries = [c for c in countries if c not in regions]
-    return sorted(countries)
+    return sorted(c for c in countries if c not in NON_COUNTRY_ENTITIES)
 
 
 def get_available_years(df: pd.DataFrame) -> Tuple[int, int]:
@@ -93,7 +166,8 @@ def get_available_years(df: pd.DataFrame) -> Tuple[int, int]:
     Returns:
         Tupla com (ano_min, ano_max)
     """
-    return int(df["Year"].min()), int(df["Year"].max())
+    year_range = df["Year"].agg(["min", "max"])
+    return int(year_range["min"]), int(year_range["max"])
 
 
 def filter_data(df: pd.DataFrame, 
@@ -112,20 +186,18 @@ def filter_data(df: pd.DataFrame,
     Returns:
         DataFrame filtrado
     """
-    df_filtered = df.copy()
+    # Combinar todos os filtros em uma única máscara e indexar uma só vez
+    mask = np.ones(len(df), dtype=bool)
     
     if countries:
-        df_filtered = df_filtered[df_filtered["Entity"].isin(countries)]
+        mask &= df["Entity"].isin(countries).to_numpy()
     
     if years:
         min_year, max_year = years
-        df_filtered = df_filtered[
-            (df_filtered["Year"] >= min_year) & 
-            (df_filtered["Year"] <= max_year)
-        ]
+        year_values = df["Year"].to_numpy()
+        mask &= (year_values >= min_year) & (year_values <= max_year)
     
     if region:
-        df_filtered = df_filtered[df_filtered["World regions according to OWID"] == region]
+        mask &= (df["World regions according to OWID"] == region).to_numpy()
     
-    return df_filtered
-
+    return df[mask]
@@ -2,15 +2,35 @@
 Sistema RAG (Retrieval-Augmented Generation) educacional
 Demonstra como funciona busca semântica e recuperação de contexto
 """
-import pickle
+import functools
+import hashlib
+import os
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import json
 
-from src.config import RAG_CONFIG, DATABASE_DIR, DOCS_DIR
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+try:
+    import faiss
+except ImportError:  # FAISS é opcional: sem ele a busca usa NumPy
+    faiss = None
+
+from src.config import RAG_CONFIG, DATASETS
+from src.data_loader import load_metadata
+
+
+def get_knowledge_base_mtimes() -> Tuple[float, ...]:
+    """
+    Retorna as datas de modificação dos arquivos-fonte da base de conhecimento
+    
+    Returns:
+        Tupla com os mtimes (0.0 para arquivos inexistentes)
+    """
+    sources = (DATASETS["hdi"]["metadata_file"], RAG_CONFIG["readme_file"])
+    return tuple(path.stat().st_mtime if path.exists() else 0.0 for path in sources)
 
 
 class RAGSystem:
@@ -18,23 +38,76 @@ class RAGSystem:
     Sistema RAG educacional para buscar informações sobre os datasets
     """
     
-    def __init__(self):
-        """Inicializa o sistema RAG"""
-        self.model = SentenceTransformer(RAG_CONFIG["model_name"])
+    def __init__(self, metadata: Optional[Dict] = None):
+        """
+        Inicializa o sistema RAG
+        
+        Args:
+            metadata: Metadados do HDI já carregados (lidos do disco se None)
+        """
+        self.metadata = metadata if metadata is not None else load_metadata("hdi")
+        self.model, self.backend = self._load_model()
         self.knowledge_base = []
         self.embeddings = None
+        # Cache LRU por instância: perguntas repetidas não são recodificadas
+        self._encode_query = functools.lru_cache(
+            maxsize=RAG_CONFIG["query_cache_size"]
+        )(self._encode_query_uncached)
         self._load_or_create_knowledge_base()
+        # Array de objetos para recuperar documentos por índices em uma operação
+        self._kb_array = np.asarray(self.knowledge_base, dtype=object)
+        self.index = self._build_index()
+    
+    @staticmethod
+    def _load_model() -> Tuple["SentenceTransformer", str]:
+        """
+        Carrega o modelo de embeddings, preferindo o ONNX quantizado (INT8)
+        
+        Cai para o backend PyTorch quando o ONNX Runtime não está disponível.
+        
+        Returns:
+            Tupla com (modelo, nome do backend)
+        """
+        # Import tardio: sentence-transformers (e PyTorch) só carregam quando o
+        # sistema RAG é de fato usado, não ao importar o módulo
+        from sentence_transformers import SentenceTransformer
+        
+        try:
+            model = SentenceTransformer(
+                RAG_CONFIG["model_name"],
+                backend="onnx",
+                model_kwargs={
+                    "file_name": RAG_CONFIG["onnx_file_name"],
+                    "provider": "CPUExecutionProvider"
+                }
+            )
+            return model, "onnx"
+        except Exception as e:
+            print(f"Backend ONNX indisponível ({e}). Usando PyTorch...")
+            return SentenceTransformer(RAG_CONFIG["model_name"]), "torch"
     
     def _load_or_create_knowledge_base(self):
         """Carrega ou cria a base de conhecimento"""
         # Tentar carregar embeddings salvos
-        if RAG_CONFIG["embeddings_cache_file"].exists():
+        embeddings_file = RAG_CONFIG["embeddings_cache_file"]
+        documents_file = RAG_CONFIG["documents_cache_file"]
+        if self._is_cache_fresh(embeddings_file, documents_file):
             try:
-                with open(RAG_CONFIG["embeddings_cache_file"], "rb") as f:
-                    cache = pickle.load(f)
-                    self.knowledge_base = cache["knowledge_base"]
-                    self.embeddings = cache["embeddings"]
-                return
+                with open(documents_file, "r", encoding="utf-8") as f:
+                    # Primeira linha: informações do cache; demais: um documento por linha
+                    cache_info = json.loads(f.readline())
+                    # Caches de versões anteriores guardam embeddings não normalizados,
+                    # e embeddings de outro backend não são comparáveis com a query
+                    if cache_info == self._cache_info():
+                        knowledge_base = [json.loads(line) for line in f if line.strip()]
+                        embeddings = np.load(embeddings_file, mmap_mode="r")
+                        # Os dois arquivos precisam ter uma linha por documento
+                        if len(knowledge_base) == embeddings.shape[0]:
+                            self.knowledge_base = knowledge_base
+                            # Converte de float16 para float32 uma única vez
+                            self.embeddings = self._normalize_embeddings(embeddings)
+                            return
+                        print("Cache inconsistente (documentos x embeddings). Recriando base de conhecimento...")
             except Exception as e:
                 print(f"Erro ao carregar cache: {e}. Recriando base de conhecimento...")
         
@@ -42,18 +115,30 @@ class RAGSystem:
         self._build_knowledge_base()
         self._save_embeddings()
     
+    @staticmethod
+    def _is_cache_fresh(*cache_files: Path) -> bool:
+        """
+        Verifica se os arquivos de cache existem e são mais novos que as fontes
+        
+        Args:
+            cache_files: Arquivos que compõem o cache
+            
+        Returns:
+            True se o cache pode ser usado
+        """
+        if not all(path.exists() for path in cache_files):
+            return False
+        cache_mtime = min(path.stat().st_mtime for path in cache_files)
+        return max(get_knowledge_base_mtimes()) <= cache_mtime
+    
     def _build_knowledge_base(self):
         """Constrói a base de conhecimento a partir dos metadados e documentação"""
         documents = []
         
-        # Carregar metadados do HDI
-        metadata_file = DATABASE_DIR / "human-development-index.metadata.json"
-        if metadata_file.exists():
-            with open(metadata_file, "r", encoding="utf-8") as f:
-                metadata = json.load(f)
-            
+        # Usar metadados do HDI
+        if self.metadata:
             # Extrair informações sobre o HDI
-            hdi_info = metadata.get("columns", {}).get("Human Development Index", {})
+            hdi_info = self.metadata.get("columns", {}).get("Human Development Index", {})
             
             # Adicionar descrição principal
             if "descriptionShort" in hdi_info:
@@ -89,20 +174,19 @@ class RAGSystem:
                 })
         
         # Carregar readme.md
-        readme_file = DATABASE_DIR / "readme.md"
+        readme_file = RAG_CONFIG["readme_file"]
         if readme_file.exists():
             with open(readme_file, "r", encoding="utf-8") as f:
                 readme_content = f.read()
             
-            # Dividir readme em seções menores
-            sections = readme_content.split("\n## ")
-            for i, section in enumerate(sections):
-                if section.strip():
-                    documents.append({
-                        "text": section.strip(),
-                        "source": f"README.md - Seção {i+1}",
-                        "type": "documentation"
-                    })
+            # Dividir readme em janelas de tokens com sobreposição
+            for i, (chunk, offset) in enumerate(self._chunk_text(readme_content)):
+                documents.append({
+                    "text": chunk,
+                    "source": f"README.md - Trecho {i+1}",
+                    "type": "documentation",
+                    "byte_offset": offset
+                })
         
         # Adicionar informações sobre estrutura dos dados
         documents.append({
@@ -129,24 +213,133 @@ class RAGSystem:
         
         # Gerar embeddings para todos os documentos
         texts = [doc["text"] for doc in documents]
-        self.embeddings = self.model.encode(texts, show_progress_bar=False)
+        self.embeddings = self._normalize_embeddings(
+            self.model.encode(
+                texts,
+                batch_size=32,
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+        )
     
-    def _save_embeddings(self):
-        """Salva os embeddings em cache"""
-        cache = {
-            "knowledge_base": self.knowledge_base,
-            "embeddings": self.embeddings
+    def _chunk_text(self, text: str) -> List[Tuple[str, int]]:
+        """
+        Divide um texto em janelas de tokens sobrepostas
+        
+        O tamanho da janela respeita o limite de tokens do modelo, evitando que
+        trechos longos sejam truncados silenciosamente no embedding.
+        
+        Args:
+            text: Texto completo
+            
+        Returns:
+            Lista de (trecho, offset em bytes do trecho no texto original)
+        """
+        # Reservar espaço para os tokens especiais ([CLS] e [SEP])
+        chunk_size = min(RAG_CONFIG["chunk_size"], self.model.max_seq_length - 2)
+        stride = chunk_size - RAG_CONFIG["chunk_overlap"]
+        
+        encoding = self.model.tokenizer(
+            text, add_special_tokens=False, return_offsets_mapping=True
+        )
+        offsets = encoding["offset_mapping"]
+        
+        chunks = []
+        for start in range(0, max(len(offsets) - RAG_CONFIG["chunk_overlap"], 1), stride):
+            window = offsets[start:start + chunk_size]
+            if not window:
+                break
+            # Recortar o texto original (preserva acentos, maiúsculas e formatação)
+            char_start, char_end = window[0][0], window[-1][1]
+            chunk = text[char_start:char_end].strip()
+            if chunk:
+                chunks.append((chunk, len(text[:char_start].encode("utf-8"))))
+        return chunks
+    
+    @staticmethod
+    def _normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+        """
+        Normaliza os embeddings (norma L2) uma única vez, em float32 contíguo,
+        para que a similaridade de cosseno vire um simples produto escalar
+        
+        Args:
+            embeddings: Matriz (n_documentos, dimensão) de embeddings
+            
+        Returns:
+            Matriz normalizada
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True).clip(min=1e-12)
+        return embeddings
+    
+    def _build_index(self):
+        """
+        Cria um índice FAISS de produto interno sobre os embeddings normalizados
+        
+        Com vetores normalizados, produto interno == similaridade de cosseno.
+        
+        Returns:
+            faiss.IndexFlatIP, ou None se o FAISS não estiver instalado
+        """
+        if faiss is None or self.embeddings is None:
+            return None
+        index = faiss.IndexFlatIP(self.embeddings.shape[1])
+        index.add(self.embeddings)
+        return index
+    
+    def _encode_query_uncached(self, query: str) -> np.ndarray:
+        """
+        Gera o embedding normalizado (float32) de uma query
+        
+        Args:
+            query: Texto da query
+            
+        Returns:
+            Vetor normalizado, somente leitura (compartilhado pelo cache)
+        """
+        embedding = self.model.encode(
+            [query], show_progress_bar=False, normalize_embeddings=True
+        )[0].astype(np.float32)
+        embedding.flags.writeable = False
+        return embedding
+    
+    def _cache_info(self) -> Dict:
+        """Retorna as informações que identificam um cache compatível"""
+        return {
+            "cache_version": RAG_CONFIG["cache_version"],
+            "backend": self.backend,
+            # Metadados diferentes geram outra base de conhecimento
+            "metadata_hash": hashlib.sha256(
+                json.dumps(self.metadata, sort_keys=True).encode("utf-8")
+            ).hexdigest()
         }
-        with open(RAG_CONFIG["embeddings_cache_file"], "wb") as f:
-            pickle.dump(cache, f)
     
-    def search(self, query: str, top_k: int = None) -> List[Dict]:
+    def _save_embeddings(self):
+        """Salva os embeddings (float16 .npy) e os documentos (JSONL) em cache"""
+        embeddings_file = RAG_CONFIG["embeddings_cache_file"]
+        documents_file = RAG_CONFIG["documents_cache_file"]
+        # Grava em arquivos temporários e troca com os.replace: uma escrita
+        # interrompida nunca deixa um cache pela metade no lugar do atual
+        embeddings_tmp = embeddings_file.with_name(embeddings_file.name + ".tmp")
+        documents_tmp = documents_file.with_name(documents_file.name + ".tmp")
+        with open(embeddings_tmp, "wb") as f:
+            np.save(f, self.embeddings.astype(np.float16))
+        with open(documents_tmp, "w", encoding="utf-8") as f:
+            lines = [self._cache_info()] + self.knowledge_base
+            f.write("\n".join(json.dumps(line, ensure_ascii=False) for line in lines))
+        os.replace(embeddings_tmp, embeddings_file)
+        os.replace(documents_tmp, documents_file)
+    
+    def search(self, query: str, top_k: int = None,
+               query_embedding: Optional[np.ndarray] = None) -> List[Dict]:
         """
         Busca documentos relevantes para uma query
         
         Args:
             query: Texto da pergunta/busca
             top_k: Número de documentos a retornar (usa config padrão se None)
+            query_embedding: Embedding normalizado da query já calculado (gerado se None)
             
         Returns:
             Lista de documentos com scores de similaridade
@@ -154,26 +347,38 @@ class RAGSystem:
         if top_k is None:
             top_k = RAG_CONFIG["top_k"]
         
-        # Gerar embedding da query
-        query_embedding = self.model.encode([query], show_progress_bar=False)
-        
-        # Calcular similaridade de cosseno
-        similarities = cosine_similarity(query_embedding, self.embeddings)[0]
+        # Gerar embedding da query (se ainda não foi calculado)
+        if query_embedding is None:
+            query_embedding = self._encode_query(query)
         
         # Obter top_k documentos mais relevantes
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        k = min(top_k, len(self.knowledge_base))
+        if k <= 0:
+            return []
+        
+        if self.index is not None:
+            # Busca por produto interno no índice FAISS (vetores já normalizados)
+            scores, top_indices = self.index.search(np.array(query_embedding, ndmin=2), k)
+            scores, top_indices = scores[0], top_indices[0]
+        else:
+            # Calcular similaridade de cosseno (vetores já normalizados)
+            similarities = self.embeddings @ query_embedding
+            # Seleção O(N) e ordenação só dos k candidatos
+            candidates = np.argpartition(-similarities, k - 1)[:k]
+            top_indices = candidates[np.argsort(-similarities[candidates])]
+            scores = similarities[top_indices]
         
         # Filtrar por threshold mínimo
-        results = []
-        for idx in top_indices:
-            score = float(similarities[idx])
-            if score >= RAG_CONFIG["similarity_threshold"]:
-                result = self.knowledge_base[idx].copy()
-                result["similarity_score"] = score
-                result["rank"] = len(results) + 1
-                results.append(result)
-        
-        return results
+        keep = scores >= RAG_CONFIG["similarity_threshold"]
+        top_indices = top_indices[keep]
+        scores = scores[keep].tolist()
+        
+        # Buscar os documentos de uma vez (fancy indexing) e montar só a saída final
+        documents = self._kb_array[top_indices]
+        return [
+            {**document, "similarity_score": score, "rank": rank}
+            for rank, (document, score) in enumerate(zip(documents, scores), start=1)
+        ]
     
     def get_query_embedding(self, query: str) -> np.ndarray:
         """
@@ -183,9 +388,9 @@ class RAGSystem:
             query: Texto da query
             
         Returns:
-            Array numpy com o embedding
+            Array numpy com o embedding (normalizado)
         """
-        return self.model.encode([query], show_progress_bar=False)[0]
+        return self._encode_query(query)
     
     def explain_rag_process(self, query: str) -> Dict:
         """
@@ -198,7 +403,7 @@ class RAGSystem:
             Dicionário com informações sobre cada etapa do processo
         """
         query_embedding = self.get_query_embedding(query)
-        results = self.search(query)
+        results = self.search(query, query_embedding=query_embedding)
         
         return {
             "query": query,
@@ -1,11 +1,178 @@
 """
 Funções de visualização reutilizáveis para o dashboard
 """
+import functools
+import itertools
+import threading
+import weakref
+import numpy as np
 import pandas as pd
-import plotly.express as px
+import plotly.colors
 import plotly.graph_objects as go
 from typing import List, Optional, Tuple
 
+from src.config import NON_COUNTRY_ENTITIES
+
+# Escala de cores do HDI, construída uma única vez
+_HDI_COLORSCALE = plotly.colors.make_colorscale(plotly.colors.sequential.Viridis)
+
+# DataFrames com pivots em cache: cada DataFrame recebe um token único (nunca
+# reaproveitado, ao contrário do id) e é guardado por referência fraca para não
+# ficar vivo só por causa do cache. O registro id -> token é limpo por
+# weakref.finalize quando o DataFrame é coletado. RLock porque o finalize pode
+# rodar (coleta de lixo) na mesma thread enquanto o lock está adquirido
+_pivot_lock = threading.RLock()
+_pivot_frames = weakref.WeakValueDictionary()
+_pivot_tokens = {}
+_pivot_counter = itertools.count()
+
+
+def _ensure_categorical(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Garante que Entity e Code são categóricas (isin/groupby por códigos inteiros)
+    
+    Não altera o DataFrame recebido; sem conversão necessária, retorna o próprio df.
+    
+    Args:
+        df: DataFrame com dados do HDI
+        
+    Returns:
+        DataFrame com Entity/Code categóricas
+    """
+    conversions = {
+        column: df[column].astype("category")
+        for column in ("Entity", "Code")
+        if column in df and not isinstance(df[column].dtype, pd.CategoricalDtype)
+    }
+    return df.assign(**conversions) if conversions else df
+
+
+def _get_entity_index(df: pd.DataFrame) -> Tuple[np.ndarray, pd.Index]:
+    """
+    Retorna a fatoração de Entity (códigos inteiros por linha e nomes únicos)
+    
+    Com Entity categórica a fatoração já está pronta no próprio dtype, então
+    não há nada a recalcular nem a guardar entre chamadas.
+    
+    Args:
+        df: DataFrame com Entity categórica (ver _ensure_categorical)
+        
+    Returns:
+        Tupla com (códigos por linha, nomes das entidades)
+    """
+    entities = df["Entity"].cat
+    return entities.codes.to_numpy(), entities.categories
+
+
+def _stats_by_year(years: np.ndarray, hdi: np.ndarray) -> dict:
+    """
+    Calcula média, mediana, mínimo e máximo do HDI por ano em uma passada NumPy
+    
+    Os valores são ordenados uma vez por (ano, HDI); assim mínimo, máximo e
+    mediana de cada ano saem por posição, e a soma por np.add.reduceat.
+    
+    Args:
+        years: Ano de cada observação
+        hdi: Valor do HDI de cada observação
+        
+    Returns:
+        Dicionário com arrays "Year", "mean", "median", "min" e "max"
+    """
+    # Descartar HDI ou ano ausentes (como o groupby("Year") fazia); um ano NaN
+    # viraria o código -1 no factorize e quebraria o bincount
+    valid = ~np.isnan(hdi) & ~pd.isna(years)
+    # Sem ordenar as chaves no factorize: só o resultado reduzido (um valor por ano) é ordenado
+    codes, uniques = pd.factorize(years[valid], sort=False)
+    order = np.lexsort((hdi[valid], codes))
+    values = hdi[valid][order]
+    
+    counts = np.bincount(codes, minlength=len(uniques))
+    starts = np.cumsum(counts) - counts
+    if len(values) == 0:
+        return {"Year": uniques, "mean": values, "median": values, "min": values, "max": values}
+    
+    stats = {
+        "Year": uniques,
+        # Acumular em float64 e devolver no dtype original (float32 após o carregamento)
+        "mean": (np.add.reduceat(values, starts, dtype=np.float64) / counts).astype(values.dtype),
+        "median": (values[starts + (counts - 1) // 2] + values[starts + counts // 2]) / 2,
+        "min": values[starts],
+        "max": values[starts + counts - 1]
+    }
+    year_order = np.argsort(uniques)
+    return {key: array[year_order] for key, array in stats.items()}
+
+
+@functools.lru_cache(maxsize=32)
+def _build_pivot(country_key: frozenset,
+                 frame_token: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Cria a matriz País x Ano do heatmap (memoizada por países e DataFrame)
+    
+    Em vez de pivot_table, os valores são espalhados direto em uma matriz NumPy;
+    np.bincount faz a média caso haja mais de um valor por (país, ano).
+    
+    Args:
+        country_key: Conjunto de países incluídos
+        frame_token: Token do DataFrame registrado em _pivot_frames
+        
+    Returns:
+        Tupla com (matriz de HDI, anos das colunas, países das linhas)
+    """
+    df = _ensure_categorical(_pivot_frames[frame_token])
+    codes, entities = _get_entity_index(df)
+    
+    # Filtrar e indexar as linhas pelos códigos inteiros de Entity
+    selected = entities.get_indexer(list(country_key))
+    mask = np.isin(codes, selected[selected >= 0])
+    present = np.unique(codes[mask])
+    entity_codes = np.searchsorted(present, codes[mask])
+    entities = entities[present]
+    year_codes, years = pd.factorize(df["Year"].to_numpy()[mask], sort=True)
+    shape = (len(entities), len(years))
+    matrix_size = shape[0] * shape[1]
+    
+    cells = np.ravel_multi_index((entity_codes, year_codes), shape)
+    hdi = df["Human Development Index"].to_numpy()[mask]
+    sums = np.bincount(cells, weights=hdi, minlength=matrix_size)
+    counts = np.bincount(cells, minlength=matrix_size)
+    filled = counts > 0
+    matrix = np.full(shape, np.nan, dtype=np.float32)
+    matrix.flat[filled] = sums[filled] / counts[filled]
+    
+    # Resultado compartilhado pelo cache: somente leitura
+    entities, years = np.asarray(entities), np.asarray(years)
+    for array in (matrix, years, entities):
+        array.flags.writeable = False
+    return matrix, years, entities
+
+
+def _forget_frame(frame_id: int):
+    """Remove do registro um DataFrame coletado (chamado por weakref.finalize)"""
+    with _pivot_lock:
+        _pivot_tokens.pop(frame_id, None)
+
+
+def _get_pivot(df: pd.DataFrame,
+               countries: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Retorna o pivot do heatmap, reaproveitando o cache para o mesmo DataFrame"""
+    with _pivot_lock:
+        token = _pivot_tokens.get(id(df))
+        if token is None:
+            token = next(_pivot_counter)
+            _pivot_tokens[id(df)] = token
+            _pivot_frames[token] = df
+            weakref.finalize(df, _forget_frame, id(df))
+    return _build_pivot(frozenset(countries), token)
+
+
+def clear_plot_cache():
+    """Descarta os pivots em cache (chamar quando os dados forem recarregados)"""
+    with _pivot_lock:
+        _build_pivot.cache_clear()
+        _pivot_frames.clear()
+        _pivot_tokens.clear()
+
 
 def plot_hdi_timeline(df: pd.DataFrame, 
                      countries: Optional[List[str]] = None,
@@ -21,30 +188,61 @@ def plot_hdi_timeline(df: pd.DataFrame,
     Returns:
         Figura Plotly
     """
-    df_plot = df.copy()
+    df = _ensure_categorical(df)
     
+    # Separar as séries por país em uma passada sobre os códigos de Entity:
+    # ordenação estável dos códigos + np.split, sem groupby nem DataFrames por país
+    codes, entities = _get_entity_index(df)
     if countries:
-        df_plot = df_plot[df_plot["Entity"].isin(countries)]
+        selected = entities.get_indexer(list(countries))
+        rows = np.flatnonzero(np.isin(codes, selected[selected >= 0]))
+    else:
+        rows = np.flatnonzero(codes >= 0)
+    rows = rows[np.argsort(codes[rows], kind="stable")]
+    present, starts = np.unique(codes[rows], return_index=True)
+    names = entities[present]
+    # Código ISO de cada país lido da primeira linha da sua série (vazio para regiões)
+    first_codes = df["Code"].to_numpy()[rows[starts]]
+    code_by_country = {
+        country: "" if pd.isna(code) else str(code)
+        for country, code in zip(names, first_codes)
+    }
+    years_by_country = dict(zip(names, np.split(df["Year"].to_numpy()[rows], starts[1:])))
+    hdi_by_country = dict(zip(names, np.split(df["Human Development Index"].to_numpy()[rows], starts[1:])))
     
-    fig = px.line(
-        df_plot,
-        x="Year",
-        y="Human Development Index",
-        color="Entity",
-        title=title,
-        labels={
-            "Year": "Ano",
-            "Human Development Index": "HDI",
-            "Entity": "País"
-        },
-        hover_data=["Code"]
-    )
+    # Uma linha por país, construída direto em graph_objects (sem Plotly Express).
+    # WebGL (Scattergl): muitas linhas de países são desenhadas pela GPU
+    # O código ISO vai uma vez por linha no bloco <extra> do hover, não por ponto.
+    # A construção é sequencial de propósito: o fatiamento já foi feito acima e o
+    # custo restante é a validação em Python do go.Scattergl, que segura o GIL
+    # (threads só somariam overhead). uid=país: com uirevision constante o
+    # Plotly.react casa o estado da legenda (linhas ocultas) pelo uid, não pela
+    # posição, que muda quando países entram ou saem da seleção
+    traces = [
+        go.Scattergl(
+            x=years_by_country[country],
+            y=hdi_by_country[country],
+            name=country,
+            uid=country,
+            mode="lines",
+            hovertemplate=(
+                f"País={country}<br>Ano=%{{x}}<br>HDI=%{{y:.3f}}"
+                f"<extra>{code_by_country[country]}</extra>"
+            )
+        )
+        for country in names
+    ]
     
+    fig = go.Figure(data=traces)
     fig.update_layout(
+        title=title,
+        legend_title_text="País",
         xaxis_title="Ano",
         yaxis_title="Índice de Desenvolvimento Humano (HDI)",
         hovermode="x unified",
-        height=500
+        height=500,
+        # Preserva zoom/legenda quando o Plotly.react atualiza os dados
+        uirevision=title
     )
     
     return fig
@@ -66,35 +264,42 @@ def plot_hdi_comparison(df: pd.DataFrame,
     Returns:
         Figura Plotly
     """
-    df_year = df[df["Year"] == year].copy()
+    df = _ensure_categorical(df)
+    
+    # Máscaras NumPy sobre os códigos de Entity, sem DataFrames intermediários
+    codes, entities = _get_entity_index(df)
+    year_mask = df["Year"].to_numpy() == year
+    codes = codes[year_mask]
+    hdi = df["Human Development Index"].to_numpy()[year_mask]
     
     # Remover entidades que não são países
-    regions = ["Africa", "Asia", "Europe", "North America", "South America", 
-               "Oceania", "World", "European Union"]
-    df_year = df_year[~df_year["Entity"].isin(regions)]
+    region_codes = entities.get_indexer(list(NON_COUNTRY_ENTITIES))
+    country_mask = ~np.isin(codes, region_codes[region_codes >= 0])
+    codes, hdi = codes[country_mask], hdi[country_mask]
     
-    # Ordenar e pegar top N
-    df_year = df_year.nlargest(top_n, "Human Development Index")
+    # Pegar top N (no máximo ~200 linhas por ano). O desempate pela ordem das
+    # linhas (alfabética) mantém o mesmo resultado de nlargest(keep="first")
+    top = np.lexsort((np.arange(len(hdi)), -hdi))[:top_n]
     
-    fig = px.bar(
-        df_year,
-        x="Human Development Index",
-        y="Entity",
+    fig = go.Figure(go.Bar(
+        x=hdi[top],
+        y=np.asarray(entities[codes[top]]),
         orientation="h",
-        title=f"{title} - {year}",
-        labels={
-            "Human Development Index": "HDI",
-            "Entity": "País"
-        },
-        color="Human Development Index",
-        color_continuous_scale="Viridis"
-    )
+        marker=dict(
+            color=hdi[top],
+            colorscale=_HDI_COLORSCALE,
+            colorbar=dict(title="HDI")
+        ),
+        hovertemplate="HDI=%{x}<br>País=%{y}<extra></extra>"
+    ))
     
     fig.update_layout(
+        title=f"{title} - {year}",
         yaxis={"categoryorder": "total ascending"},
         height=max(400, top_n * 30),
         xaxis_title="Índice de Desenvolvimento Humano (HDI)",
-        yaxis_title=""
+        yaxis_title="",
+        uirevision=title
     )
     
     return fig
@@ -114,26 +319,28 @@ def plot_hdi_heatmap(df: pd.DataFrame,
     Returns:
         Figura Plotly
     """
-    df_plot = df[df["Entity"].isin(countries)].copy()
+    # Criar matriz País x Ano (memoizada)
+    matrix, years, entities = _get_pivot(df, countries)
     
-    # Criar pivot table
-    pivot = df_plot.pivot_table(
-        values="Human Development Index",
-        index="Entity",
-        columns="Year",
-        aggfunc="mean"
-    )
+    fig = go.Figure(go.Heatmap(
+        z=matrix,
+        x=years,
+        y=entities,
+        colorscale=_HDI_COLORSCALE,
+        colorbar=dict(title="HDI"),
+        hovertemplate="Ano=%{x}<br>País=%{y}<br>HDI=%{z}<extra></extra>"
+    ))
     
-    fig = px.imshow(
-        pivot,
+    fig.update_layout(
         title=title,
-        labels=dict(x="Ano", y="País", color="HDI"),
-        aspect="auto",
-        color_continuous_scale="Viridis"
+        xaxis_title="Ano",
+        yaxis_title="País",
+        # Primeiro país no topo, como em uma tabela
+        yaxis_autorange="reversed",
+        height=max(400, len(countries) * 30),
+        uirevision=title
     )
     
-    fig.update_layout(height=max(400, len(countries) * 30))
-    
     return fig
 
 
@@ -151,46 +358,52 @@ def plot_hdi_statistics(df: pd.DataFrame,
     Returns:
         Figura Plotly
     """
-    df_plot = df.copy()
+    df = _ensure_categorical(df)
     
-    if countries:
-        df_plot = df_plot[df_plot["Entity"].isin(countries)]
+    # Só as colunas usadas nas estatísticas; o filtro não copia as demais
+    columns = ["Year", "Human Development Index"]
+    df_plot = df[columns] if not countries else df.loc[df["Entity"].isin(countries), columns]
     
     # Calcular estatísticas por ano
-    stats = df_plot.groupby("Year")["Human Development Index"].agg([
-        "mean", "median", "std", "min", "max"
-    ]).reset_index()
+    stats = _stats_by_year(
+        df_plot["Year"].to_numpy(),
+        df_plot["Human Development Index"].to_numpy()
+    )
     
     fig = go.Figure()
     
-    fig.add_trace(go.Scatter(
+    fig.add_trace(go.Scattergl(
         x=stats["Year"],
         y=stats["mean"],
         name="Média",
+        uid="mean",
         mode="lines+markers",
         line=dict(color="blue", width=2)
     ))
     
-    fig.add_trace(go.Scatter(
+    fig.add_trace(go.Scattergl(
         x=stats["Year"],
         y=stats["median"],
         name="Mediana",
+        uid="median",
         mode="lines+markers",
         line=dict(color="green", width=2)
     ))
     
-    fig.add_trace(go.Scatter(
+    fig.add_trace(go.Scattergl(
         x=stats["Year"],
         y=stats["min"],
         name="Mínimo",
+        uid="min",
         mode="lines+markers",
         line=dict(color="red", width=1, dash="dash")
     ))
     
-    fig.add_trace(go.Scatter(
+    fig.add_trace(go.Scattergl(
         x=stats["Year"],
         y=stats["max"],
         name="Máximo",
+        uid="max",
         mode="lines+markers",
         line=dict(color="purple", width=1, dash="dash")
     ))
@@ -200,7 +413,8 @@ def plot_hdi_statistics(df: pd.DataFrame,
         xaxis_title="Ano",
         yaxis_title="HDI",
         hovermode="x unified",
-        height=500
+        height=500,
+        uirevision=title
     )
     
     return fig